@@ -1,3 +1,4 @@
+import os
 from dataclasses import dataclass, field
 from typing import Optional
 
@@ -89,6 +90,37 @@ class ProgramArguments:
         metadata={'help': 'Dimension of the feature word vectors.'}
     )
 
+    cache_embeddings: bool = field(
+        default=False,
+        metadata={'help': 'Compute the embeddings of the frozen model once and store them on disk (float16).'}
+    )
+
+    compile_probe: bool = field(
+        default=False,
+        metadata={'help': 'Compile the probe with torch.compile during training.'}
+    )
+
+    num_proc: Optional[int] = field(
+        default=os.cpu_count(),
+        metadata={'help': 'Number of processes used to parse the code samples.'}
+    )
+
+    n_jobs: Optional[int] = field(
+        default=-1,
+        metadata={'help': 'Number of threads used by t-SNE in the visualizations (-1 for all the cores).'}
+    )
+
+    tsne_backend: Optional[str] = field(
+        default='opentsne',
+        metadata={'help': 'Implementation of t-SNE used in the visualizations.', 'choices': ['opentsne', 'sklearn']}
+    )
+
+    projection: Optional[str] = field(
+        default='tsne',
+        metadata={'help': '2D projection used in the visualizations (pca is a linear preview).',
+                  'choices': ['tsne', 'pca']}
+    )
+
     seed: Optional[int] = field(
         default=42,
         metadata={'help': 'Seed for experiments replication.'}
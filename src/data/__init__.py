@@ -1,5 +1,5 @@
 from .data_loading import download_codesearchnet_dataset, create_splits,\
-    convert_sample_to_features, PY_LANGUAGE, JS_LANGUAGE,\
+    convert_sample_to_features, convert_example_to_features, convert_dataset_to_features, PY_LANGUAGE, JS_LANGUAGE,\
     PY_PARSER, JS_PARSER, GO_PARSER, GO_LANGUAGE, \
     PHP_LANGUAGE, RUBY_LANGUAGE, JAVA_LANGUAGE, CSHARP_LANGUAGE, JAVA_PARSER, RUBY_PARSER, PHP_PARSER, LANGUAGES, \
     download_codexglue_csharp, CSHARP_PARSER, download_codexglue_c, C_LANGUAGE, C_PARSER, PARSER_OBJECT_BY_NAME, \
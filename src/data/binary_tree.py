@@ -1,7 +1,10 @@
+import heapq
+from collections import defaultdict
+
 import networkx as nx
 import numpy as np
 
-from src.data.code2ast import get_id, get_root_ast
+from src.data.code2ast import get_root_ast
 
 SEPARATOR = '<sep>'
 
@@ -12,7 +15,7 @@ def ast2binary(G):
         out_edges = list(G.out_edges(current_node_G))
         if len(out_edges) == 2:
             for _, m in out_edges:
-                id_m_new = get_id(new_G)
+                id_m_new = len(new_G)
                 new_G.add_node(id_m_new, **G.nodes[m])
                 new_G.add_edge(parent_in_new_G, id_m_new)
                 ast2binary_aux(m, G, new_G, id_m_new)
@@ -29,20 +32,20 @@ def ast2binary(G):
         elif len(out_edges) > 2:
             out_nodes = [m for _, m in out_edges]
             out_nodes.sort(key=lambda m: G.nodes[m]['start'])
-            id_m_new = get_id(new_G)
+            id_m_new = len(new_G)
             new_G.add_node(id_m_new, **G.nodes[out_nodes[0]])
             new_G.add_edge(parent_in_new_G, id_m_new)
             ast2binary_aux(out_nodes[0], G, new_G, id_m_new)
-            new_empty_id = get_id(new_G)
+            new_empty_id = len(new_G)
             new_G.add_node(new_empty_id, type='<empty>')
             new_G.add_edge(parent_in_new_G, new_empty_id)
             for j, out_node in enumerate(out_nodes[1:]):
                 if len(list(new_G.out_edges(new_empty_id))) == 1 and len(out_nodes[1:]) - j > 1:
-                    new_empty_id_new = get_id(new_G)
+                    new_empty_id_new = len(new_G)
                     new_G.add_node(new_empty_id_new, type='<empty>')
                     new_G.add_edge(new_empty_id, new_empty_id_new)
                     new_empty_id = new_empty_id_new
-                id_m_new = get_id(new_G)
+                id_m_new = len(new_G)
                 new_G.add_node(id_m_new, **G.nodes[out_node])
                 new_G.add_edge(new_empty_id, id_m_new)
                 ast2binary_aux(out_node, G, new_G, id_m_new)
@@ -69,13 +72,26 @@ def get_most_left(tree, nodes):
     return tree.nodes[nodes_sort[0]]['start']
 
 
-def get_left_right_child(tree, node):
+# start of the left-most leaf below every node of the subtree, computed in one post-order pass
+def get_most_left_starts(tree, node):
+    most_left = {}
+    for n in nx.dfs_postorder_nodes(tree, node):
+        if tree.out_degree(n) == 0:
+            most_left[n] = tree.nodes[n]['start']
+        else:
+            most_left[n] = min(most_left[m] for _, m in tree.out_edges(n))
+    return most_left
+
+
+def get_left_right_child(tree, node, most_left=None):
     child_1 = list(tree.out_edges(node))[0][1]
     child_2 = list(tree.out_edges(node))[1][1]
-    child_1_leaves = get_leaves(tree, child_1)
-    child_2_leaves = get_leaves(tree, child_2)
-    child_1_left_most = get_most_left(tree, child_1_leaves)
-    child_2_left_most = get_most_left(tree, child_2_leaves)
+    if most_left is None:
+        child_1_left_most = get_most_left(tree, get_leaves(tree, child_1))
+        child_2_left_most = get_most_left(tree, get_leaves(tree, child_2))
+    else:
+        child_1_left_most = most_left[child_1]
+        child_2_left_most = most_left[child_2]
     if child_1_left_most < child_2_left_most:
         return child_1, child_2
     else:
@@ -83,96 +99,102 @@ def get_left_right_child(tree, node):
 
 
 def tree_to_distance(tree, node):
-    if tree.out_degree(node) == 0:
-        d = []
-        c = []
-        h = 0
-        if 'unary' in tree.nodes[node]:
-            u = [tree.nodes[node]['unary']]
-        else:
-            u = ['<empty>']
-    else:
-        left_child, right_child = get_left_right_child(tree, node)
-        d_l, c_l, h_l, u_l = tree_to_distance(tree, left_child)
-        d_r, c_r, h_r, u_r = tree_to_distance(tree, right_child)
+    most_left = get_most_left_starts(tree, node)
+    d = []
+    c = []
+    u = []
+
+    # in-order traversal filling d, c and u, returns the height of the subtree
+    def tree_to_distance_aux(node):
+        if tree.out_degree(node) == 0:
+            if 'unary' in tree.nodes[node]:
+                u.append(tree.nodes[node]['unary'])
+            else:
+                u.append('<empty>')
+            return 0
+        left_child, right_child = get_left_right_child(tree, node, most_left)
+        h_l = tree_to_distance_aux(left_child)
+        # the height of the node is only known once the right subtree is visited
+        j = len(d)
+        d.append(None)
+        c.append(tree.nodes[node]['type'])
+        h_r = tree_to_distance_aux(right_child)
         h = max(h_r, h_l) + 1
-        d = d_l + [h] + d_r
-        c = c_l + [tree.nodes[node]['type']] + c_r
-        u = u_l + u_r
+        d[j] = h
+        return h
+
+    h = tree_to_distance_aux(node)
     return d, c, h, u
 
 
 def distance_to_tree(d, c, u, tokens):
-    def distance_to_tree_aux(G, d, c, u, father, tokens, start_token):
-        if d == []:
-            new_id = get_id(G)
-            G.add_node(new_id, type=tokens[0], start=start_token, unary=u[0])
+    # the subtree over tokens[start:end + 1] is split at the largest distance in d[start:end],
+    # working on index ranges avoids copying the sequences at every split
+    def distance_to_tree_aux(G, start, end, father):
+        if start == end:
+            new_id = len(G)
+            G.add_node(new_id, type=tokens[start], start=start, unary=u[start])
             G.add_edge(father, new_id)
         else:
-            i = np.argmax(d)
-            new_id = get_id(G)
+            i = start + int(np.argmax(d[start:end]))
+            new_id = len(G)
             G.add_node(new_id, type=c[i])
             if father != None:
                 G.add_edge(father, new_id)
-            distance_to_tree_aux(G, d[0:i], c[0:i], u[0:i + 1], new_id, tokens[0:i + 1], start_token)
-            distance_to_tree_aux(G, d[i + 1:], c[i + 1:], u[i + 1:], new_id, tokens[i + 1:], start_token + i + 1)
+            distance_to_tree_aux(G, start, i, new_id)
+            distance_to_tree_aux(G, i + 1, end, new_id)
 
+    d = np.asarray(d)
     G = nx.DiGraph()
-    distance_to_tree_aux(G, d, c, u, None, tokens, 0)
+    distance_to_tree_aux(G, 0, len(d), None)
     return G
 
 
+# splice out the <empty> nodes in one pass, the parent of each one adopts its children
 def remove_empty_nodes(G):
     g = G.copy()
-    while len([n for n in g if g.nodes[n]['type'] == '<empty>']) != 0:
-        g0 = g.copy()
-        n = [n for n in g if g.nodes[n]['type'] == '<empty>'][0]
+    for n in [n for n, t in g.nodes(data='type') if t == '<empty>']:
         if g.in_degree(n) == 0:
-            g0.nodes[n]['type'] = 'bad_root'
-            g = g0
+            g.nodes[n]['type'] = 'bad_root'
             continue
-        edges_in = list(g.in_edges(n))
-        edges_out = list(g.out_edges(n))
-        if len(edges_in) != 0:
-            u, _ = edges_in[0]
-            for _, v in edges_out:
-                g0.add_edge(u, v)
-        g0.remove_node(n)
-        g = g0
-        # print(len([n for n in g if not has_terminals(g, n)]))
+        u = next(iter(g.predecessors(n)))
+        for v in list(g.successors(n)):
+            g.add_edge(u, v)
+        g.remove_node(n)
     return g
 
 
+# replace each node labelled a<sep>b<sep>... by a chain of nodes a -> b -> ..., in one pass
 def extend_complex_nodes(G):
     g = G.copy()
-    while len([n for n in g if SEPARATOR in g.nodes[n]['type'] and g.out_edges(n) != 0]) != 0:
-        g0 = g.copy()
-        n = [n for n in g if SEPARATOR in g.nodes[n]['type'] and g.out_edges(n) != 0][0]
+    next_id = max(g) + 1 if len(g) != 0 else 0
+    for n in [n for n, t in g.nodes(data='type') if SEPARATOR in t]:
         edges_in = list(g.in_edges(n))
         edges_out = list(g.out_edges(n))
         labels = g.nodes[n]['type'].split(SEPARATOR)
         new_nodes = []
         for l in labels:
-            new_id = get_id(g0)
-            g0.add_node(new_id, type=l)
+            new_id = next_id
+            next_id += 1
+            g.add_node(new_id, type=l)
             if len(new_nodes) != 0:
-                g0.add_edge(new_nodes[-1], new_id)
+                g.add_edge(new_nodes[-1], new_id)
             new_nodes.append(new_id)
         for u, _ in edges_in:
-            g0.add_edge(u, new_nodes[0])
+            g.add_edge(u, new_nodes[0])
         for _, v in edges_out:
-            g0.add_edge(new_nodes[-1], v)
-        g0.remove_node(n)
-        g = g0
-        # print(len([n for n in g if not has_terminals(g, n)]))
+            g.add_edge(new_nodes[-1], v)
+        g.remove_node(n)
     return g
 
 
 def add_unary(G):
     g = G.copy()
+    next_id = max(g) + 1 if len(g) != 0 else 0
     for n in [n for n in g if g.out_degree(n) == 0]:
         if g.nodes[n]['unary'] != '<empty>':
-            new_id = get_id(g)
+            new_id = next_id
+            next_id += 1
             g.add_node(new_id, type=g.nodes[n]['unary'])
             g.add_edge(new_id, n)
             u, _ = list(g.in_edges(n))[0]
@@ -181,27 +203,38 @@ def add_unary(G):
     return g
 
 
+# sorted starts of the leaves below every node, computed in one post-order pass
+def get_leaves_starts(G):
+    leaves_starts = {}
+    for n in nx.dfs_postorder_nodes(G):
+        if G.out_degree(n) == 0:
+            leaves_starts[n] = [G.nodes[n]['start']]
+        else:
+            leaves_starts[n] = list(heapq.merge(*[leaves_starts[m] for _, m in G.out_edges(n)]))
+    return leaves_starts
+
+
+def get_span_label(G, n, leaves_starts):
+    return G.nodes[n]['type'] + '-' + '-'.join([str(s) for s in leaves_starts[n]])
+
+
 def get_multiset_ast(G, filter_non_terminal=None):
+    leaves_starts = get_leaves_starts(G)
     result = []
     for n in G:
         if G.out_degree(n) > 0:
-            if filter_non_terminal is None:
-                leaves = get_leaves(G, n)
-                leaves = sorted(leaves, key=lambda n: G.nodes[n]['start'])
-                result.append(G.nodes[n]['type'] + '-' + '-'.join([str(G.nodes[l]['start']) for l in leaves]))
-            else:
-                if G.nodes[n]['type'] == filter_non_terminal:
-                    leaves = get_leaves(G, n)
-                    leaves = sorted(leaves, key=lambda n: G.nodes[n]['start'])
-                    result.append(G.nodes[n]['type'] + '-' + '-'.join([str(G.nodes[l]['start']) for l in leaves]))
+            if filter_non_terminal is None or G.nodes[n]['type'] == filter_non_terminal:
+                result.append(get_span_label(G, n, leaves_starts))
     return result
 
 
 def get_precision_recall_f1(G_true, G_pred, filter_non_terminal=None):
     m_true = get_multiset_ast(G_true, filter_non_terminal)
     m_pred = get_multiset_ast(G_pred, None)
-    prec = float(len([n for n in m_pred if n in m_true])) / float(len(m_pred))
-    rec = float(len([n for n in m_pred if n in m_true])) / float(len(m_true))
+    m_true_set = set(m_true)
+    hits = sum(1 for n in m_pred if n in m_true_set)
+    prec = float(hits) / float(len(m_pred))
+    rec = float(hits) / float(len(m_true))
     if prec + rec == 0:
         return 0, 0, 0
     f1 = 2 * prec * rec / (prec + rec)
@@ -209,14 +242,16 @@ def get_precision_recall_f1(G_true, G_pred, filter_non_terminal=None):
 
 
 def get_recall_non_terminal(G_true, G_pred):
-    non_terminals = set([])
+    # group the spans of the true tree by non-terminal in a single sweep
+    leaves_starts = get_leaves_starts(G_true)
+    m_true_by_non_terminal = defaultdict(list)
     for n in G_true:
         if G_true.out_degree(n) > 0:
-            non_terminals.add(G_true.nodes[n]['type'])
+            m_true_by_non_terminal[G_true.nodes[n]['type']].append(get_span_label(G_true, n, leaves_starts))
     dic_results = {}
     m_pred = get_multiset_ast(G_pred, None)
-    for n in non_terminals:
-        m_true = get_multiset_ast(G_true, n)
-        rec = float(len([n for n in m_pred if n in m_true])) / float(len(m_true))
+    for n, m_true in m_true_by_non_terminal.items():
+        m_true_set = set(m_true)
+        rec = float(len([m for m in m_pred if m in m_true_set])) / float(len(m_true))
         dic_results[n] = rec
     return dic_results
@@ -5,50 +5,77 @@ from .utils import remove_comments_and_docstrings_python, \
     remove_comments_php
 
 
-# aux function, get a new id in the graph
-def get_id(G):
-    if len(G) == 0:
-        return 0
-    return max(list(G)) + 1
-
-
 # aux function used to get the graph associated to the ast
+# iterative pre-order walk with a tree-sitter cursor, node ids are assigned in visiting order
 def get_graph_from_tree(node, G, id_father):
-    # traverse children
-    for child in node.children:
-        is_terminal_child = (len(child.children) == 0)
-        id_child = get_id(G)
-        G.add_node(id_child, type=child.type,
-                   is_terminal=is_terminal_child,
-                   start=child.start_byte,
-                   end=child.end_byte)
-        G.add_edge(id_father, id_child)
-        get_graph_from_tree(child, G, id_child)
-
-
-# get token given the code, the start byte and the end byte
+    next_id = len(G)
+    new_nodes = []
+    new_edges = []
+    cursor = node.walk()
+    if not cursor.goto_first_child():
+        return
+    # stack with the ids of the ancestors of the current node
+    parents = [id_father]
+    while True:
+        child = cursor.node
+        id_child = next_id
+        next_id += 1
+        new_nodes.append((id_child, {'type': child.type,
+                                     'is_terminal': child.child_count == 0,
+                                     'start': child.start_byte,
+                                     'end': child.end_byte}))
+        new_edges.append((parents[-1], id_child))
+        if cursor.goto_first_child():
+            parents.append(id_child)
+            continue
+        while not cursor.goto_next_sibling():
+            if len(parents) == 1:
+                G.add_nodes_from(new_nodes)
+                G.add_edges_from(new_edges)
+                return
+            cursor.goto_parent()
+            parents.pop()
+
+
+# get token given the code (str or its utf8 bytes), the start byte and the end byte
 def get_token(code, start, end):
-    return bytes(code, "utf8")[start:end].decode("utf-8")
+    if isinstance(code, str):
+        code = bytes(code, "utf8")
+    return code[start:end].decode("utf-8")
 
 
 # get the tokens of the dependency tree
 def get_tokens_dep(T, code):
-    return [get_token(code, T.nodes[t]['start'], T.nodes[t]['end']) for t in sorted(list(T.nodes),
-                                                                                    key=lambda n: T.nodes[n]['start'])]
+    code_bytes = bytes(code, "utf8")
+    return [get_token(code_bytes, att['start'], att['end']) for att in
+            sorted([att for _, att in T.nodes(data=True)], key=lambda att: att['start'])]
 
 
 def solve_string_problems(G):
-    strings = [n for n in G if (G.nodes[n]['type'] == 'string' or ('string_literal' in G.nodes[n]['type']))
-               and not G.nodes[n]['is_terminal']]
+    strings = [n for n, att in G.nodes(data=True) if (att['type'] == 'string' or ('string_literal' in att['type']))
+               and not att['is_terminal']]
     for n in strings:
         if n not in G:
             continue
-        for v in nx.single_source_shortest_path(G, n).keys():
-            if v != n:
-                G.remove_node(v)
+        # drop the whole subtree below the string node
+        G.remove_nodes_from(nx.descendants(G, n))
         G.nodes[n]['is_terminal'] = True
 
 
+# parse the code and returns the graph of its ast, the root has id 0
+def get_ast_graph(code, parser):
+    tree = parser.parse(bytes(code, "utf8"))
+    # keep the root as a graph attribute, so it does not need to be searched
+    G = nx.DiGraph(root=0)
+    # add root
+    G.add_node(0, type=tree.root_node.type,
+               is_terminal=False,
+               start=tree.root_node.start_byte,
+               end=tree.root_node.end_byte)
+    get_graph_from_tree(tree.root_node, G, 0)
+    return G
+
+
 # preprocess code, obtain the ast and returns a network graph.
 # it returns the graph of the ast and the preprocessed code
 # directed graph
@@ -56,26 +83,10 @@ def code2ast(code, parser, lang='python'):
     if lang == 'python':
         # preprocess
         code = remove_comments_and_docstrings_python(code)
-        tree = parser.parse(bytes(code, "utf8"))
-
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
     elif lang == 'javascript' or lang == 'go':
         code = remove_comments_and_docstrings_java_js(code)
-        tree = parser.parse(bytes(code, "utf8"))
-
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
         if lang == 'go':
             remove_new_line_tokens(G)
     elif lang == 'php':
@@ -84,105 +95,61 @@ def code2ast(code, parser, lang='python'):
         if not code.endswith('?>'):
             code = code + '\n?>'
         code = remove_comments_php(code)
-        tree = parser.parse(bytes(code, "utf8"))
-
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
     elif lang == 'java':
         code = 'public class Main {\n' + code + '\n}'
         code = remove_comments_and_docstrings_java_js(code)
-        tree = parser.parse(bytes(code, "utf8"))
-
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
     elif lang == 'ruby':
-        tree = parser.parse(bytes(code, "utf8"))
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
-
+        G = get_ast_graph(code, parser)
         # remove comments and parse again, not the best way to do that
-        code = remove_comments_ast(G, code)
-        tree = parser.parse(bytes(code, "utf8"))
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        # without comments the code does not change, so the first parse is kept
+        if any(t == 'comment' for _, t in G.nodes(data='type')):
+            code = remove_comments_ast(G, code)
+            G = get_ast_graph(code, parser)
     elif lang == 'c':
         code = remove_comments_php(code)  # the same function is ok for c
-        tree = parser.parse(bytes(code, "utf8"))
-
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
     else:
-        tree = parser.parse(bytes(code, "utf8"))
-        G = nx.DiGraph()
-        # add root
-        G.add_node(0, type=tree.root_node.type,
-                   is_terminal=False,
-                   start=tree.root_node.start_byte,
-                   end=tree.root_node.end_byte)
-        get_graph_from_tree(tree.root_node, G, 0)
+        G = get_ast_graph(code, parser)
     solve_string_problems(G)
     return G, code
 
 
 def remove_new_line_tokens(G):
-    to_remove = [n for n in G if G.nodes[n]['type'] == '\n']
+    to_remove = [n for n, t in G.nodes(data='type') if t == '\n']
     G.remove_nodes_from(to_remove)
 
 
 def remove_comments_ast(G, code):
-    start_end_comments = [(G.nodes[n]['start'], G.nodes[n]['end']) for n in G if G.nodes[n]['type'] == 'comment']
+    start_end_comments = sorted((G.nodes[n]['start'], G.nodes[n]['end']) for n in G if G.nodes[n]['type'] == 'comment')
     code_bytes = bytes(code, "utf8")
+    # keep the slices between consecutive comments
     new_bytes = []
-    for j, b in enumerate(code_bytes):
-        to_add = True
-        for s, e in start_end_comments:
-            if e > j >= s:
-                to_add = False
-        if to_add:
-            new_bytes.append(code_bytes[j:j + 1])
+    last_end = 0
+    for s, e in start_end_comments:
+        if s > last_end:
+            new_bytes.append(code_bytes[last_end:s])
+        last_end = max(last_end, e)
+    new_bytes.append(code_bytes[last_end:])
     new_bytes = b''.join(new_bytes)
     return new_bytes.decode("utf-8")
 
 
 def get_tokens_ast(T, code):
-    return [get_token(code, T.nodes[t]['start'], T.nodes[t]['end']) for t in
-            sorted([n for n in T if T.nodes[n]['is_terminal']],
-                   key=lambda n: T.nodes[n]['start'])]
+    code_bytes = bytes(code, "utf8")
+    return [get_token(code_bytes, att['start'], att['end']) for att in
+            sorted([att for _, att in T.nodes(data=True) if att['is_terminal']],
+                   key=lambda att: att['start'])]
 
 
 def get_root_ast(G):
-    for n in G:
-        if G.in_degree(n) == 0:
+    if 'root' in G.graph:
+        return G.graph['root']
+    for n, d in G.in_degree():
+        if d == 0:
             return n
 
 
 def has_error(G):
-    for n in G:
-        if G.nodes[n]['type'] == 'ERROR':
-            return True
-    return False
+    return any(t == 'ERROR' for _, t in G.nodes(data='type'))
@@ -8,6 +8,7 @@ import shutil
 from collections import Counter
 
 import gdown
+from datasets.fingerprint import Hasher
 from tqdm import tqdm
 from tree_sitter import Language, Parser
 
@@ -17,6 +18,9 @@ from .utils import download_url, unzip_file
 
 logger = logging.getLogger(__name__)
 
+# bump it when the output of convert_sample_to_features changes, so cached datasets are not reused
+FEATURES_VERSION = 1
+
 CSN_DATASET_SPLIT_PATH = 'https://github.com/guoday/CodeBERT/raw/master/GraphCodeBERT/codesearch/dataset.zip'
 CSN_DATASET_BASE_PATH = 'https://zenodo.org/records/7908468/files/' # 'https://s3.amazonaws.com/code-search-net/CodeSearchNet/v2/'
 
@@ -247,6 +251,20 @@ def convert_sample_to_features(code, parser, lang):
     }
 
 
+# to be used with dataset.map, the parser is looked up inside the function so that it
+# can be pickled and run in several processes
+def convert_example_to_features(example, lang):
+    return convert_sample_to_features(example['original_string'], PARSER_OBJECT_BY_NAME[lang], lang)
+
+
+# the fingerprint only depends on the input dataset, the language and FEATURES_VERSION,
+# so a split that was already converted is loaded from the datasets cache
+def convert_dataset_to_features(dataset, lang, num_proc=None):
+    fingerprint = Hasher.hash([dataset._fingerprint, lang, FEATURES_VERSION])
+    return dataset.map(convert_example_to_features, fn_kwargs={'lang': lang}, num_proc=num_proc,
+                       load_from_cache_file=True, new_fingerprint=fingerprint)
+
+
 def get_non_terminals_labels(train_set_labels, valid_set_labels, test_set_labels):
     all_labels = [label for seq in train_set_labels for label in seq] + \
                  [label for seq in valid_set_labels for label in seq] + \
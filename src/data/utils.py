@@ -114,6 +114,18 @@ def match_tokenized_to_untokenized_bert(untokenized_sent, tokenizer):
     return flat_tokenized, mapping
 
 
+def get_number_subtokens(code_tokens, tokenizer, bpe):
+    # same count as the match_tokenized_to_untokenized functions, with one batched call of the tokenizer
+    if bpe:
+        code_tokens = code_tokens[:1] + [' ' + t for t in code_tokens[1:]]
+    input_ids = tokenizer(code_tokens, add_special_tokens=False)['input_ids']
+    # lone 'Ġ' sub-tokens are dropped by match_tokenized_to_untokenized_roberta
+    space_id = tokenizer.convert_tokens_to_ids('Ġ') if bpe else None
+    if space_id == tokenizer.unk_token_id:
+        space_id = None
+    return sum(len(ids) - ids.count(space_id) for ids in input_ids)
+
+
 MODEL_TYPES_MATCH = {
     'roberta': match_tokenized_to_untokenized_roberta,
     't5': match_tokenized_to_untokenized_roberta,
@@ -10,7 +10,7 @@ from transformers import AutoTokenizer
 
 from data import download_codesearchnet_dataset, download_codexglue_csharp, download_codexglue_c, PARSER_OBJECT_BY_NAME
 from data.code2ast import code2ast, has_error, get_tokens_ast
-from data.utils import match_tokenized_to_untokenized_roberta, match_tokenized_to_untokenized_bert
+from data.utils import get_number_subtokens
 from main import setup_logger
 
 tokenizer_roberta = AutoTokenizer.from_pretrained('roberta-base')
@@ -38,12 +38,10 @@ def filter_samples(code, max_length, lang, parser):
         return False
     code_tokens = get_tokens_ast(G, code_pre)
     for tokenizer in tokenizers_bpe:
-        t, _ = match_tokenized_to_untokenized_roberta(untokenized_sent=code_tokens, tokenizer=tokenizer)
-        if len(t) + 2 > max_length:
+        if get_number_subtokens(code_tokens, tokenizer, bpe=True) + 2 > max_length:
             return False
     for tokenizer in tokenizers_wordpiece:
-        t, _ = match_tokenized_to_untokenized_bert(untokenized_sent=code_tokens, tokenizer=tokenizer)
-        if len(t) + 2 > max_length:
+        if get_number_subtokens(code_tokens, tokenizer, bpe=False) + 2 > max_length:
             return False
     return True
 
@@ -1,3 +1,3 @@
 from .probe import ParserProbe
 from .loss import ParserLoss
-from .utils import get_embeddings, align_function
\ No newline at end of file
+from .utils import get_embeddings, align_function, EmbeddingsCache
\ No newline at end of file
@@ -1,5 +1,7 @@
+import os
+
+import numpy as np
 import torch
-from torch.nn.utils.rnn import pad_sequence
 from torch_scatter import scatter_mean
 
 
@@ -14,8 +16,36 @@ def get_embeddings(all_inputs, all_attentions, model, layer, model_type):
 
 
 def align_function(embs, align):
-    seq = []
-    for j, emb in enumerate(embs):
-        seq.append(scatter_mean(emb, align[j], dim=0))
+    # a single scatter over the flattened batch, each sample gets its own block of max_len rows
+    batch_size, _, hidden_dim = embs.shape
+    max_len = int(align.max()) + 1
+    flat_align = (align + torch.arange(batch_size, device=align.device)[:, None] * max_len).reshape(-1)
+    aligned = scatter_mean(embs.reshape(-1, hidden_dim), flat_align, dim=0, dim_size=batch_size * max_len)
     # remove the last token since it corresponds to <\s> or padding to much the lens
-    return pad_sequence(seq, batch_first=True)[:, :-1, :]
+    return aligned.view(batch_size, max_len, hidden_dim)[:, :-1, :]
+
+
+# aligned word embeddings of a whole dataset, stored as float16 in a memmap indexed by sample id
+class EmbeddingsCache:
+    def __init__(self, path, lengths, hidden_dim):
+        self.path = path
+        self.hidden_dim = hidden_dim
+        self.lengths = np.asarray(lengths)
+        self.offsets = np.concatenate([[0], np.cumsum(self.lengths)])
+        self.embeddings = np.memmap(path, dtype=np.float16, mode='w+', shape=(int(self.offsets[-1]), hidden_dim))
+
+    def store(self, ids, embs):
+        embs = embs.to(torch.float16).cpu().numpy()
+        for i, idx in enumerate(ids.tolist()):
+            self.embeddings[self.offsets[idx]:self.offsets[idx + 1]] = embs[i, :self.lengths[idx]]
+
+    def get_batch(self, ids):
+        ids = ids.tolist()
+        batch = np.zeros((len(ids), self.lengths[ids].max(), self.hidden_dim), dtype=np.float32)
+        for i, idx in enumerate(ids):
+            batch[i, :self.lengths[idx]] = self.embeddings[self.offsets[idx]:self.offsets[idx + 1]]
+        return torch.from_numpy(batch)
+
+    def remove(self):
+        del self.embeddings
+        os.remove(self.path)
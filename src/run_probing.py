@@ -13,30 +13,17 @@ from torch.utils.data import DataLoader
 from tqdm import tqdm
 from transformers import AutoModel, AutoTokenizer, AutoConfig, RobertaModel, T5EncoderModel, AutoModelForCausalLM
 
-from data import convert_sample_to_features, collator_fn, \
-    PY_PARSER, GO_PARSER, JS_PARSER, PHP_PARSER, JAVA_PARSER, \
-    RUBY_PARSER, LANGUAGES, CSHARP_PARSER, C_PARSER, collator_with_mask, PARSER_OBJECT_BY_NAME
+from data import convert_dataset_to_features, collator_fn, LANGUAGES, collator_with_mask
 from data.binary_tree import distance_to_tree, remove_empty_nodes, \
     extend_complex_nodes, get_precision_recall_f1, add_unary, get_recall_non_terminal
 from data.data_loading import get_non_terminals_labels, convert_to_ids, convert_to_ids_multilingual
 from data.utils import MODEL_TYPES_MATCH
-from probe import ParserProbe, ParserLoss, get_embeddings, align_function
+from probe import ParserProbe, ParserLoss, get_embeddings, align_function, EmbeddingsCache
 from utils import set_seed
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 logger = logging.getLogger(__name__)
 
-PARSER_OBJECT_BY_NAME = {
-    'python': PY_PARSER,
-    'javascript': JS_PARSER,
-    'go': GO_PARSER,
-    'php': PHP_PARSER,
-    'ruby': RUBY_PARSER,
-    'java': JAVA_PARSER,
-    'csharp': CSHARP_PARSER,
-    'c': C_PARSER
-}
-
 
 def seed_worker(_):
     worker_seed = torch.initial_seed() % 2 ** 32
@@ -90,7 +77,41 @@ def get_lmodel(args):
     return lmodel
 
 
-def run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained, args):
+def collate_with_ids(collate_fn):
+    return lambda batch: collate_fn(batch) + (torch.tensor([b['idx'] for b in batch]),)
+
+
+def build_embeddings_cache(dataset, collate_fn, lmodel, name, args):
+    # the language model is frozen, so its embeddings are computed once and read back at every epoch
+    logger.info(f'Caching the embeddings of the {name} set.')
+    dataset = dataset.add_column('idx', list(range(len(dataset))))
+    dataloader = DataLoader(dataset=dataset,
+                            batch_size=args.batch_size,
+                            shuffle=False,
+                            collate_fn=collate_with_ids(collate_fn),
+                            num_workers=0)
+    cache = EmbeddingsCache(os.path.join(args.output_path, f'embeddings_{name}.bin'), dataset['num_tokens'],
+                            args.hidden)
+    lmodel.eval()
+    try:
+        with torch.autocast(device_type='cuda', dtype=torch.float16, enabled=args.device == 'cuda'):
+            for batch in tqdm(dataloader,
+                              desc='[caching batch]',
+                              bar_format='{desc:<10}{percentage:3.0f}%|{bar:100}{r_bar}'):
+                all_inputs, all_attentions, alignment, ids = batch[0], batch[1], batch[6], batch[-1]
+                embds = get_embeddings(all_inputs.to(args.device), all_attentions.to(args.device), lmodel,
+                                       args.layer, args.model_type)
+                embds = align_function(embds.to(args.device), alignment.to(args.device))
+                cache.store(ids, embds)
+    except BaseException:
+        cache.remove()
+        raise
+    cache.embeddings.flush()
+    return dataset, cache
+
+
+def run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained, args,
+                      train_cache=None, valid_cache=None):
     masking = args.do_train_all_languages or args.do_holdout_training
     if pretrained:
         optimizer = torch.optim.Adam([probe_model.vectors_c, probe_model.vectors_u], lr=args.lr)
@@ -98,6 +119,8 @@ def run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, m
         optimizer = torch.optim.Adam(probe_model.parameters(), lr=args.lr)
     scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=0)
     criterion = ParserLoss(loss='rank', pretrained=pretrained)
+    # the compiled module shares its parameters with probe_model, which is the one optimized and saved
+    probe_forward = torch.compile(probe_model, dynamic=True) if args.compile_probe else probe_model
 
     probe_model.train()
     lmodel.eval()
@@ -108,28 +131,41 @@ def run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, m
         for step, batch in enumerate(tqdm(train_dataloader,
                                           desc='[training batch]',
                                           bar_format='{desc:<10}{percentage:3.0f}%|{bar:100}{r_bar}')):
+            if train_cache is not None:
+                *batch, ids = batch
             if not masking:
                 all_inputs, all_attentions, ds, cs, us, batch_len_tokens, alignment = batch
                 masks_c = None
                 masks_u = None
             else:
                 all_inputs, all_attentions, ds, cs, us, batch_len_tokens, alignment, masks_c, masks_u = batch
-                masks_c = masks_c.to(args.device)
-                masks_u = masks_u.to(args.device)
-
-            embds = get_embeddings(all_inputs.to(args.device), all_attentions.to(args.device), lmodel, args.layer,
-                                   args.model_type)
-            embds = align_function(embds.to(args.device), alignment.to(args.device))
+                masks_c = masks_c.to(args.device, non_blocking=True)
+                masks_u = masks_u.to(args.device, non_blocking=True)
+
+            # the batches come from pinned memory, so these copies overlap with the forward pass
+            ds = ds.to(args.device, non_blocking=True)
+            cs = cs.to(args.device, non_blocking=True)
+            us = us.to(args.device, non_blocking=True)
+            batch_len_tokens = batch_len_tokens.to(args.device, non_blocking=True)
+
+            optimizer.zero_grad(set_to_none=True)
+            if train_cache is None:
+                embds = get_embeddings(all_inputs.to(args.device, non_blocking=True),
+                                       all_attentions.to(args.device, non_blocking=True), lmodel, args.layer,
+                                       args.model_type)
+                embds = align_function(embds.to(args.device), alignment.to(args.device, non_blocking=True))
+            else:
+                embds = train_cache.get_batch(ids)
 
-            d_pred, scores_c, scores_u = probe_model(embds.to(args.device))
+            d_pred, scores_c, scores_u = probe_forward(embds.to(args.device, non_blocking=True))
             loss = criterion(
-                d_pred=d_pred.to(args.device),
-                scores_c=scores_c.to(args.device),
-                scores_u=scores_u.to(args.device),
-                d_real=ds.to(args.device),
-                c_real=cs.to(args.device),
-                u_real=us.to(args.device),
-                length_batch=batch_len_tokens.to(args.device),
+                d_pred=d_pred,
+                scores_c=scores_c,
+                scores_u=scores_u,
+                d_real=ds,
+                c_real=cs,
+                u_real=us,
+                length_batch=batch_len_tokens,
                 masks_c=masks_c, masks_u=masks_u)
 
             if not pretrained:
@@ -139,11 +175,10 @@ def run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, m
                 loss += reg
             loss.backward()
             optimizer.step()
-            optimizer.zero_grad()
             training_loss += loss.item()
 
         training_loss = training_loss / len(train_dataloader)
-        eval_loss, _, _, _ = run_probing_eval(valid_dataloader, probe_model, lmodel, criterion, args)
+        eval_loss, _, _, _ = run_probing_eval(valid_dataloader, probe_forward, lmodel, criterion, args, valid_cache)
         scheduler.step(eval_loss)
         logger.info(f'[epoch {epoch}] train loss: {round(training_loss, 4)}, validation loss: {round(eval_loss, 4)}')
         metrics['training_loss'].append(round(training_loss, 4))
@@ -170,9 +205,6 @@ def run_probing_train(args: argparse.Namespace):
     logger.info('Running probing training.')
     logger.info('-' * 100)
 
-    # select the parser
-    parser = PARSER_OBJECT_BY_NAME[args.lang]
-
     logger.info('Loading tokenizer')
     tokenizer = AutoTokenizer.from_pretrained(args.pretrained_model_name_or_path)
 
@@ -186,9 +218,9 @@ def run_probing_train(args: argparse.Namespace):
     test_set = load_dataset('json', data_files=data_files, split='test')
 
     # get d and c for each sample
-    train_set = train_set.map(lambda e: convert_sample_to_features(e['original_string'], parser, args.lang))
-    valid_set = valid_set.map(lambda e: convert_sample_to_features(e['original_string'], parser, args.lang))
-    test_set = test_set.map(lambda e: convert_sample_to_features(e['original_string'], parser, args.lang))
+    train_set = convert_dataset_to_features(train_set, args.lang, args.num_proc)
+    valid_set = convert_dataset_to_features(valid_set, args.lang, args.num_proc)
+    test_set = convert_dataset_to_features(test_set, args.lang, args.num_proc)
 
     # get class labels-ids mapping for c and u
     labels_file_path = os.path.join(args.dataset_name_or_path, 'labels.pkl')
@@ -202,7 +234,7 @@ def run_probing_train(args: argparse.Namespace):
             pickle.dump({
                 'labels_to_ids_c': labels_to_ids_c, 'ids_to_labels_c': ids_to_labels_c,
                 'labels_to_ids_u': labels_to_ids_u, 'ids_to_labels_u': ids_to_labels_u
-            }, f)
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
     else:
         with open(labels_file_path, 'rb') as f:
             data = pickle.load(f)
@@ -221,28 +253,45 @@ def run_probing_train(args: argparse.Namespace):
 
     match_function = MODEL_TYPES_MATCH[args.model_type]
 
-    train_dataloader = DataLoader(dataset=train_set,
-                                  batch_size=args.batch_size,
-                                  shuffle=True,
-                                  collate_fn=lambda batch: collator_fn(batch, tokenizer, match_function),
-                                  num_workers=0,
-                                  generator=torch.Generator().manual_seed(args.seed))
-    valid_dataloader = DataLoader(dataset=valid_set,
-                                  batch_size=args.batch_size,
-                                  shuffle=False,
-                                  collate_fn=lambda batch: collator_fn(batch, tokenizer, match_function),
-                                  num_workers=0)
-
     lmodel = get_lmodel(args)
     lmodel.eval()
-    probe_model = ParserProbe(
-        probe_rank=args.rank,
-        hidden_dim=args.hidden,
-        number_labels_c=len(labels_to_ids_c),
-        number_labels_u=len(labels_to_ids_u)).to(args.device)
-    metrics = {'training_loss': [], 'validation_loss': [], 'test_precision': None, 'test_recall': None, 'test_f1': None}
 
-    run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained=False, args=args)
+    collate_fn = lambda batch: collator_fn(batch, tokenizer, match_function)
+    train_cache, valid_cache = None, None
+    # the embeddings files are removed even if the training fails
+    try:
+        if args.cache_embeddings:
+            train_set, train_cache = build_embeddings_cache(train_set, collate_fn, lmodel, 'train', args)
+            valid_set, valid_cache = build_embeddings_cache(valid_set, collate_fn, lmodel, 'valid', args)
+            collate_fn = collate_with_ids(collate_fn)
+
+        train_dataloader = DataLoader(dataset=train_set,
+                                      batch_size=args.batch_size,
+                                      shuffle=True,
+                                      collate_fn=collate_fn,
+                                      num_workers=0,
+                                      pin_memory=args.device == 'cuda',
+                                      generator=torch.Generator().manual_seed(args.seed))
+        valid_dataloader = DataLoader(dataset=valid_set,
+                                      batch_size=args.batch_size,
+                                      shuffle=False,
+                                      collate_fn=collate_fn,
+                                      num_workers=0,
+                                      pin_memory=args.device == 'cuda')
+
+        probe_model = ParserProbe(
+            probe_rank=args.rank,
+            hidden_dim=args.hidden,
+            number_labels_c=len(labels_to_ids_c),
+            number_labels_u=len(labels_to_ids_u)).to(args.device)
+        metrics = {'training_loss': [], 'validation_loss': [], 'test_precision': None, 'test_recall': None, 'test_f1': None}
+
+        run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained=False, args=args,
+                          train_cache=train_cache, valid_cache=valid_cache)
+    finally:
+        for cache in (train_cache, valid_cache):
+            if cache is not None:
+                cache.remove()
 
     logger.info('Loading test set.')
     test_dataloader = DataLoader(dataset=test_set,
@@ -271,7 +320,7 @@ def run_probing_train(args: argparse.Namespace):
         pickle.dump(metrics, f)
 
 
-def run_probing_eval(test_dataloader, probe_model, lmodel, criterion, args):
+def run_probing_eval(test_dataloader, probe_model, lmodel, criterion, args, cache=None):
     probe_model.eval()
     masking = args.do_train_all_languages or args.do_holdout_training
     eval_loss = 0.0
@@ -285,33 +334,39 @@ def run_probing_eval(test_dataloader, probe_model, lmodel, criterion, args):
         for step, batch in enumerate(tqdm(test_dataloader,
                                           desc='[test batch]',
                                           bar_format='{desc:<10}{percentage:3.0f}%|{bar:100}{r_bar}')):
-
+            if cache is not None:
+                *batch, ids = batch
             if not masking:
                 all_inputs, all_attentions, ds, cs, us, batch_len_tokens, alignment = batch
                 masks_c = None
                 masks_u = None
             else:
                 all_inputs, all_attentions, ds, cs, us, batch_len_tokens, alignment, masks_c, masks_u = batch
-                masks_c = masks_c.to(args.device)
-                masks_u = masks_u.to(args.device)
-
-            ds = ds.to(args.device)
-            cs = cs.to(args.device)
-            us = us.to(args.device)
-
-            embds = get_embeddings(all_inputs.to(args.device), all_attentions.to(args.device), lmodel, args.layer,
-                                   args.model_type)
-            embds = align_function(embds.to(args.device), alignment.to(args.device))
+                masks_c = masks_c.to(args.device, non_blocking=True)
+                masks_u = masks_u.to(args.device, non_blocking=True)
+
+            ds = ds.to(args.device, non_blocking=True)
+            cs = cs.to(args.device, non_blocking=True)
+            us = us.to(args.device, non_blocking=True)
+            batch_len_tokens = batch_len_tokens.to(args.device, non_blocking=True)
+
+            if cache is None:
+                embds = get_embeddings(all_inputs.to(args.device, non_blocking=True),
+                                       all_attentions.to(args.device, non_blocking=True), lmodel, args.layer,
+                                       args.model_type)
+                embds = align_function(embds.to(args.device), alignment.to(args.device, non_blocking=True))
+            else:
+                embds = cache.get_batch(ids)
 
-            d_pred, scores_c, scores_u = probe_model(embds.to(args.device))
+            d_pred, scores_c, scores_u = probe_model(embds.to(args.device, non_blocking=True))
             loss = criterion(
-                d_pred=d_pred.to(args.device),
-                scores_c=scores_c.to(args.device),
-                scores_u=scores_u.to(args.device),
-                d_real=ds.to(args.device),
-                c_real=cs.to(args.device),
-                u_real=us.to(args.device),
-                length_batch=batch_len_tokens.to(args.device),
+                d_pred=d_pred,
+                scores_c=scores_c,
+                scores_u=scores_u,
+                d_real=ds,
+                c_real=cs,
+                u_real=us,
+                length_batch=batch_len_tokens,
                 masks_c=masks_c, masks_u=masks_u)
             eval_loss += loss.item()
 
@@ -321,8 +376,7 @@ def run_probing_eval(test_dataloader, probe_model, lmodel, criterion, args):
             scores_c = torch.argmax(scores_c, dim=2)
             scores_u = torch.argmax(scores_u, dim=2)
 
-            batch_len_tokens = batch_len_tokens.to(args.device)
-            lens_d = (batch_len_tokens - 1).to(args.device)
+            lens_d = batch_len_tokens - 1
             max_len_d = torch.max(lens_d)
             mask_c = torch.arange(max_len_d, device=args.device)[None, :] < lens_d[:, None]
             mask_u = torch.arange(max_len_d + 1, device=args.device)[None, :] < batch_len_tokens[:, None]
@@ -397,14 +451,16 @@ def run_probing_eval_f1(test_dataloader, probe_model, lmodel, ids_to_labels_c, i
             scores_c = torch.argmax(scores_c, dim=2)
             scores_u = torch.argmax(scores_u, dim=2)
 
-            for i, len_tokens in enumerate(batch_len_tokens):
-                len_tokens = len_tokens.item()
-                d_pred_current = d_pred[i, 0:len_tokens - 1].tolist()
-                score_c_current = scores_c[i, 0:len_tokens - 1].tolist()
-                score_u_current = scores_u[i, 0:len_tokens].tolist()
-                ds_current = ds[i, 0:len_tokens - 1].tolist()
-                cs_current = cs[i, 0:len_tokens - 1].tolist()
-                us_current = us[i, 0:len_tokens].tolist()
+            # the whole batch is converted to python lists, the samples are sliced from them
+            d_pred, scores_c, scores_u = d_pred.tolist(), scores_c.tolist(), scores_u.tolist()
+            ds, cs, us = ds.tolist(), cs.tolist(), us.tolist()
+            for i, len_tokens in enumerate(batch_len_tokens.tolist()):
+                d_pred_current = d_pred[i][0:len_tokens - 1]
+                score_c_current = scores_c[i][0:len_tokens - 1]
+                score_u_current = scores_u[i][0:len_tokens]
+                ds_current = ds[i][0:len_tokens - 1]
+                cs_current = cs[i][0:len_tokens - 1]
+                us_current = us[i][0:len_tokens]
 
                 if masking:
                     c = cs_current[0]
@@ -472,14 +528,16 @@ def run_probing_eval_recall_non_terminal(test_dataloader, probe_model, lmodel, i
             scores_c = torch.argmax(scores_c, dim=2)
             scores_u = torch.argmax(scores_u, dim=2)
 
-            for i, len_tokens in enumerate(batch_len_tokens):
-                len_tokens = len_tokens.item()
-                d_pred_current = d_pred[i, 0:len_tokens - 1].tolist()
-                score_c_current = scores_c[i, 0:len_tokens - 1].tolist()
-                score_u_current = scores_u[i, 0:len_tokens].tolist()
-                ds_current = ds[i, 0:len_tokens - 1].tolist()
-                cs_current = cs[i, 0:len_tokens - 1].tolist()
-                us_current = us[i, 0:len_tokens].tolist()
+            # the whole batch is converted to python lists, the samples are sliced from them
+            d_pred, scores_c, scores_u = d_pred.tolist(), scores_c.tolist(), scores_u.tolist()
+            ds, cs, us = ds.tolist(), cs.tolist(), us.tolist()
+            for i, len_tokens in enumerate(batch_len_tokens.tolist()):
+                d_pred_current = d_pred[i][0:len_tokens - 1]
+                score_c_current = scores_c[i][0:len_tokens - 1]
+                score_u_current = scores_u[i][0:len_tokens]
+                ds_current = ds[i][0:len_tokens - 1]
+                cs_current = cs[i][0:len_tokens - 1]
+                us_current = us[i][0:len_tokens]
 
                 cs_labels = [ids_to_labels_c[c] for c in cs_current]
                 us_labels = [ids_to_labels_u[c] for c in us_current]
@@ -502,9 +560,6 @@ def run_probing_eval_recall_non_terminal(test_dataloader, probe_model, lmodel, i
 
 
 def run_probing_test(args):
-    # select the parser
-    parser = PARSER_OBJECT_BY_NAME[args.lang]
-
     logger.info('Loading tokenizer')
     tokenizer = AutoTokenizer.from_pretrained(args.pretrained_model_name_or_path)
 
@@ -513,7 +568,7 @@ def run_probing_test(args):
     test_set = load_dataset('json', data_files=data_files, split='test')
 
     # get d and c for each sample
-    test_set = test_set.map(lambda e: convert_sample_to_features(e['original_string'], parser, args.lang))
+    test_set = convert_dataset_to_features(test_set, args.lang, args.num_proc)
 
     # get class labels-ids mapping for c and u
     labels_file_path = os.path.join(args.dataset_name_or_path, 'labels.pkl')
@@ -592,14 +647,8 @@ def run_probing_all_languages(args, exclude=None):
         data_files[f'test_{lang}'] = os.path.join(args.dataset_name_or_path, lang, 'test.jsonl')
 
     data_sets = {x: load_dataset('json', data_files=y) for x, y in data_files.items()}
-    data_sets = {
-        x: y['train'].map(
-            lambda e: convert_sample_to_features(e['original_string'], PARSER_OBJECT_BY_NAME[x.split('_')[1]],
-                                                 x.split('_')[1]))
-        if 'train_' in x else y['train'].map(
-            lambda e: convert_sample_to_features(e['original_string'], PARSER_OBJECT_BY_NAME[x.split('_')[1]],
-                                                 x.split('_')[1]))
-        for x, y in data_sets.items()}
+    data_sets = {x: convert_dataset_to_features(y['train'], x.split('_')[1], args.num_proc)
+                 for x, y in data_sets.items()}
 
     labels_c = []
     labels_u = []
@@ -619,7 +668,7 @@ def run_probing_all_languages(args, exclude=None):
                 pickle.dump({
                     'labels_to_ids_c': labels_to_ids_c, 'ids_to_labels_c': ids_to_labels_c,
                     'labels_to_ids_u': labels_to_ids_u, 'ids_to_labels_u': ids_to_labels_u
-                }, f)
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
         else:
             with open(labels_file_path, 'rb') as f:
                 data = pickle.load(f)
@@ -639,9 +688,9 @@ def run_probing_all_languages(args, exclude=None):
 
     # save labels
     with open(os.path.join(args.output_path, 'global_labels_c.pkl'), 'wb') as f:
-        pickle.dump(labels_to_ids_c_global, f)
+        pickle.dump(labels_to_ids_c_global, f, protocol=pickle.HIGHEST_PROTOCOL)
     with open(os.path.join(args.output_path, 'global_labels_u.pkl'), 'wb') as f:
-        pickle.dump(labels_to_ids_u_global, f)
+        pickle.dump(labels_to_ids_u_global, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     data_sets = {x: y.map(lambda e: convert_to_ids_multilingual(e['c'], 'c', labels_to_ids_c_global, x.split('_')[1]))
                  for x, y in data_sets.items()}
@@ -662,35 +711,49 @@ def run_probing_all_languages(args, exclude=None):
 
     match_function = MODEL_TYPES_MATCH[args.model_type]
 
-    train_dataloader = DataLoader(dataset=train_set,
-                                  batch_size=args.batch_size,
-                                  shuffle=True,
-                                  collate_fn=lambda batch: collator_with_mask(batch, tokenizer,
-                                                                              ids_to_labels_c_global,
-                                                                              ids_to_labels_u_global,
-                                                                              match_function),
-                                  generator=torch.Generator().manual_seed(args.seed),
-                                  num_workers=5)
-    valid_dataloader = DataLoader(dataset=valid_set,
-                                  batch_size=args.batch_size,
-                                  shuffle=False,
-                                  collate_fn=lambda batch: collator_with_mask(batch, tokenizer,
-                                                                              ids_to_labels_c_global,
-                                                                              ids_to_labels_u_global,
-                                                                              match_function),
-                                  num_workers=5)
-
     lmodel = get_lmodel(args)
     lmodel.eval()
-    probe_model = ParserProbe(
-        probe_rank=args.rank,
-        hidden_dim=args.hidden,
-        number_labels_c=len(labels_to_ids_c_global),
-        number_labels_u=len(labels_to_ids_u_global)).to(args.device)
 
-    metrics = {'training_loss': [], 'validation_loss': [], 'test_precision': None, 'test_recall': None, 'test_f1': None}
-
-    run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained=False, args=args)
+    collate_fn = lambda batch: collator_with_mask(batch, tokenizer,
+                                                  ids_to_labels_c_global,
+                                                  ids_to_labels_u_global,
+                                                  match_function)
+    train_cache, valid_cache = None, None
+    # the embeddings files are removed even if the training fails
+    try:
+        if args.cache_embeddings:
+            train_set, train_cache = build_embeddings_cache(train_set, collate_fn, lmodel, 'train', args)
+            valid_set, valid_cache = build_embeddings_cache(valid_set, collate_fn, lmodel, 'valid', args)
+            collate_fn = collate_with_ids(collate_fn)
+
+        train_dataloader = DataLoader(dataset=train_set,
+                                      batch_size=args.batch_size,
+                                      shuffle=True,
+                                      collate_fn=collate_fn,
+                                      generator=torch.Generator().manual_seed(args.seed),
+                                      num_workers=5,
+                                      pin_memory=args.device == 'cuda')
+        valid_dataloader = DataLoader(dataset=valid_set,
+                                      batch_size=args.batch_size,
+                                      shuffle=False,
+                                      collate_fn=collate_fn,
+                                      num_workers=5,
+                                      pin_memory=args.device == 'cuda')
+
+        probe_model = ParserProbe(
+            probe_rank=args.rank,
+            hidden_dim=args.hidden,
+            number_labels_c=len(labels_to_ids_c_global),
+            number_labels_u=len(labels_to_ids_u_global)).to(args.device)
+
+        metrics = {'training_loss': [], 'validation_loss': [], 'test_precision': None, 'test_recall': None, 'test_f1': None}
+
+        run_train_general(probe_model, lmodel, train_dataloader, valid_dataloader, metrics, pretrained=False, args=args,
+                          train_cache=train_cache, valid_cache=valid_cache)
+    finally:
+        for cache in (train_cache, valid_cache):
+            if cache is not None:
+                cache.remove()
 
     logger.info('Loading test set.')
     test_dataloader = DataLoader(dataset=test_set,
@@ -739,11 +802,8 @@ def run_probing_all_languages_test(args):
         data_files[f'test_{lang}'] = os.path.join(args.dataset_name_or_path, lang, 'test.jsonl')
 
     data_sets = {x: load_dataset('json', data_files=y) for x, y in data_files.items()}
-    data_sets = {
-        x: y['train'].map(
-            lambda e: convert_sample_to_features(e['original_string'], PARSER_OBJECT_BY_NAME[x.split('_')[1]],
-                                                 x.split('_')[1]))
-        for x, y in data_sets.items()}
+    data_sets = {x: convert_dataset_to_features(y['train'], x.split('_')[1], args.num_proc)
+                 for x, y in data_sets.items()}
 
     with open(os.path.join(args.output_path, 'global_labels_c.pkl'), 'rb') as f:
         labels_to_ids_c_global = pickle.load(f)
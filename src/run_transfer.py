@@ -9,7 +9,7 @@ from torch.utils.data import DataLoader
 from transformers import AutoTokenizer
 
 from probe import ParserProbe
-from data import PARSER_OBJECT_BY_NAME, convert_sample_to_features, collator_fn
+from data import convert_dataset_to_features, collator_fn
 from data.data_loading import convert_to_ids
 from run_probing import get_lmodel, run_probing_eval_f1
 
@@ -49,16 +49,13 @@ DATASET = 'dataset'
 
 
 def run_probe(args, probe_model):
-    # select the parser
-    parser = PARSER_OBJECT_BY_NAME[args.target_lang]
-
     tokenizer = AutoTokenizer.from_pretrained(args.pretrained_model_name_or_path)
 
     data_files = {'test': os.path.join(DATASET, args.target_lang, 'test.jsonl')}
     test_set = load_dataset('json', data_files=data_files, split='test')
 
     # get d and c for each sample
-    test_set = test_set.map(lambda e: convert_sample_to_features(e['original_string'], parser, args.target_lang))
+    test_set = convert_dataset_to_features(test_set, args.target_lang, args.num_proc)
 
     # get class labels-ids mapping for c and u
     labels_file_path = os.path.join(DATASET, args.target_lang, 'labels.pkl')
@@ -117,6 +114,7 @@ if __name__ == '__main__':
     parser.add_argument('--target_lang', type=str, default='php')
     parser.add_argument('--model_type', type=str, default='roberta')
     parser.add_argument('--out_dir', help='output directory', default='./transfer')
+    parser.add_argument('--num_proc', type=int, default=os.cpu_count(), help='processes used to parse the code')
     args = parser.parse_args()
     args.dispatch_model_weights = False
     args.run_name = ''
@@ -3,7 +3,10 @@ import logging
 import os
 import pickle
 
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import joblib
 import networkx as nx
 import numpy as np
 import torch
@@ -12,15 +15,14 @@ from openTSNE import TSNE
 from scipy.spatial import KDTree
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE as SklearnTSNE
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 from transformers import AutoModel, AutoTokenizer, T5EncoderModel
-from tree_sitter import Parser
 from yellowbrick.cluster import KElbowVisualizer
 import plotly.express as px
 
-from data import PY_LANGUAGE, JS_LANGUAGE, GO_LANGUAGE
-from data import convert_sample_to_features, LANGUAGES, collator_with_mask
+from data import convert_dataset_to_features, LANGUAGES, collator_with_mask, PARSER_OBJECT_BY_NAME
 from data.binary_tree import ast2binary, tree_to_distance, distance_to_tree, \
     extend_complex_nodes, add_unary, remove_empty_nodes, get_precision_recall_f1, \
     get_recall_non_terminal, SEPARATOR
@@ -30,7 +32,7 @@ from data.utils import match_tokenized_to_untokenized_roberta
 from probe import ParserProbe
 from probe.utils import get_embeddings, align_function
 from run_probing import generate_baseline
-from run_probing import get_lmodel, parsers
+from run_probing import get_lmodel
 
 logger = logging.getLogger(__name__)
 
@@ -64,14 +66,8 @@ def run_visualization(args):
             lmodel = generate_baseline(lmodel)
         lmodel = lmodel.to(args.device)
 
-    # select the parser
-    parser = Parser()
-    if args.lang == 'python':
-        parser.set_language(PY_LANGUAGE)
-    elif args.lang == 'javascript':
-        parser.set_language(JS_LANGUAGE)
-    elif args.lang == 'go':
-        parser.set_language(GO_LANGUAGE)
+    # select the parser, the one already built for the language is reused
+    parser = PARSER_OBJECT_BY_NAME[args.lang]
 
     # load the labels
     labels_file_path = os.path.join(args.dataset_name_or_path, 'labels.pkl')
@@ -93,9 +89,13 @@ def run_visualization(args):
 
     __run_visualization_code_samples(lmodel, tokenizer, final_probe_model, code_samples, parser,
                                      ids_to_labels_c, ids_to_labels_u, args)
-    vectors_c = final_probe_model.vectors_c.detach().cpu().numpy().T
-    vectors_u = final_probe_model.vectors_u.detach().cpu().numpy().T
-    __run_visualization_vectors(vectors_c, vectors_u, ids_to_labels_c, ids_to_labels_u, args)
+    vectors_c = np.ascontiguousarray(final_probe_model.vectors_c.detach().cpu().numpy().T, dtype=np.float32)
+    vectors_u = np.ascontiguousarray(final_probe_model.vectors_u.detach().cpu().numpy().T, dtype=np.float32)
+    for vectors, ids_to_labels, type_labels in [(vectors_c, ids_to_labels_c, 'c'), (vectors_u, ids_to_labels_u, 'u')]:
+        # the monolingual labels have no language suffix, all of them belong to args.lang
+        nonterminals = np.array([ids_to_labels[i] for i in range(len(ids_to_labels))])
+        __run_visualization_vectors(vectors, ids_to_labels, nonterminals, np.full(len(nonterminals), args.lang),
+                                    type_labels, args)
 
 
 def __run_visualization_code_samples(lmodel, tokenizer, probe_model, code_samples,
@@ -166,8 +166,8 @@ def __run_visualization_code_samples(lmodel, tokenizer, probe_model, code_sample
         nx.draw(nx.Graph(pred_tree), labels=nx.get_node_attributes(pred_tree, 'type'), with_labels=True,
                 ax=axis[1])
         axis[1].set_title("Pred ast")
-        plt.show()
         plt.savefig(f'fig_{c}_{args.lang}.png')
+        plt.close(figure)
 
         labels_axis = [tokens[i] + '-' + tokens[i + 1] for i in range(0, len(tokens) - 1)]
         figure, axis = plt.subplots(2, figsize=(40, 40))
@@ -180,8 +180,8 @@ def __run_visualization_code_samples(lmodel, tokenizer, probe_model, code_sample
         axis[1].set_title("Pred dist")
         for ix, label in enumerate(cs_labels):
             axis[1].annotate(label, (labels_axis[ix], d_pred_current[ix]))
-        plt.show()
         plt.savefig(f'fig_{c}_{args.lang}_syn_dis.png')
+        plt.close(figure)
 
 
 COLORS = {'java': 'r',
@@ -194,61 +194,121 @@ COLORS = {'java': 'r',
           }
 
 
-def __run_visualization_vectors(vectors, ids_to_labels, type_labels, args, method='TSNE'):
+def __normalize(vectors, inplace=False):
+    # the squared norms come from einsum, so no squared copy of the vectors is allocated
+    inv_norms = np.reciprocal(np.sqrt(np.einsum('ij,ij->i', vectors, vectors)))[:, np.newaxis]
+    if inplace:
+        vectors *= inv_norms
+        return vectors
+    return vectors * inv_norms
+
+
+def __split_labels(ids_to_labels):
+    # non-terminal and language of every label id, parsed just once
+    splits = [ids_to_labels[i].split('--') for i in range(len(ids_to_labels))]
+    return np.array([s[0] for s in splits]), np.array([s[1] for s in splits])
+
+
+def __load_global_labels(args, type_labels):
+    labels_file_path = os.path.join(args.output_path, f'global_labels_{type_labels}.pkl')
+    with open(labels_file_path, 'rb') as f:
+        labels_to_ids = pickle.load(f)
+    ids_to_labels = {y: x for x, y in labels_to_ids.items()}
+    # the labels are parsed here, the consumers only index the non-terminal and language arrays
+    nonterminals, langs = __split_labels(ids_to_labels)
+    return labels_to_ids, ids_to_labels, nonterminals, langs
+
+
+def __fit_tsne(vectors, backend, perplexity, initialization, seed, n_jobs, verbose):
+    # openTSNE (FFT gradients, approximate neighbors) by default, sklearn on demand
+    if backend == 'sklearn':
+        return SklearnTSNE(n_components=2, learning_rate='auto', perplexity=perplexity, init=initialization,
+                           random_state=seed, n_jobs=n_jobs, verbose=int(verbose)).fit_transform(vectors)
+    if backend == 'opentsne':
+        return np.asarray(TSNE(n_components=2, perplexity=perplexity, initialization=initialization,
+                               random_state=seed, n_jobs=n_jobs, verbose=verbose).fit(vectors))
+    raise ValueError(f'Unknown t-SNE backend {backend}.')
+
+
+def __run_tsne(vectors, args, perplexity=30.0, initialization='random', verbose=False, use_cache=True):
+    fit_tsne = __fit_tsne
+    # the monolingual visualization has no run directory, so nothing is cached there
+    if use_cache and getattr(args, 'output_path', None) is not None:
+        # the embeddings are cached in the run directory, keyed by the content of the vectors and the t-SNE parameters
+        memory = joblib.Memory(location=os.path.join(args.output_path, 'tsne_cache'), verbose=0)
+        fit_tsne = memory.cache(__fit_tsne, ignore=['n_jobs', 'verbose'])
+    return fit_tsne(vectors, args.tsne_backend, perplexity, initialization, args.seed, args.n_jobs, verbose)
+
+
+def __run_projection(vectors, args, perplexity=30.0, initialization='random', verbose=False, use_cache=True):
+    # a single truncated SVD is enough for a preview of the language geometry, t-SNE otherwise
+    if args.projection == 'pca':
+        return PCA(n_components=2, random_state=args.seed).fit_transform(vectors)
+    if args.projection == 'tsne':
+        return __run_tsne(vectors, args, perplexity=perplexity, initialization=initialization, verbose=verbose,
+                          use_cache=use_cache)
+    raise ValueError(f'Unknown projection {args.projection}.')
+
+
+def __plot_label_vectors(v_2d, ids_to_labels, nonterminals, langs, title, plot_name, annotate_nonterminals=False):
+    visible = np.char.find(nonterminals, SEPARATOR) < 0
+
+    figure, axis = plt.subplots(1, figsize=(20, 20))
+    axis.set_title(title)
+    # one scatter call per language, so every language gets a single legend entry
+    for lang in np.unique(langs[visible]):
+        ixs = np.flatnonzero(visible & (langs == lang))
+        axis.scatter(v_2d[ixs, 0], v_2d[ixs, 1], color=COLORS[lang], label=lang)
+    axis.legend()
+
+    for ix in np.flatnonzero(visible):
+        axis.annotate(nonterminals[ix] if annotate_nonterminals else ids_to_labels[ix], (v_2d[ix, 0], v_2d[ix, 1]))
+    plt.savefig(plot_name)
+    plt.close(figure)
+
+
+def __run_visualization_vectors(vectors, ids_to_labels, nonterminals, langs, type_labels, args, method=None):
+    if method is None:
+        method = args.projection.upper()
     if method == 'TSNE':
         perplexity = 30.0
         if type_labels == 'u':
             perplexity = 5.0
-        vectors = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
-        v_2d = TSNE(n_components=2, learning_rate='auto', perplexity=perplexity,
-                    init='random', random_state=args.seed).fit_transform(vectors)
+        vectors = __normalize(vectors)
+        v_2d = __run_tsne(vectors, args, perplexity=perplexity)
+    elif method == 'PCA':
+        vectors_norm = __normalize(vectors)
+        v_2d = PCA(n_components=2, random_state=args.seed).fit_transform(vectors_norm)
     else:
-        vectors_norm = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
-        v_2d = PCA(n_components=2).fit_transform(vectors_norm)
-
-    figure, axis = plt.subplots(1, figsize=(20, 20))
-    axis.set_title(f"Vectors {type_labels}")
-    for ix, label in ids_to_labels.items():
-        if SEPARATOR in label:
-            continue
-        l = label.split('--')[1]
-        axis.scatter(v_2d[ix, 0], v_2d[ix, 1], color=COLORS[l], label=l)
+        raise ValueError(f'Unknown projection method {method}.')
 
-    for ix, label in ids_to_labels.items():
-        if SEPARATOR in label:
-            continue
-        axis.annotate(label, (v_2d[ix, 0], v_2d[ix, 1]))
-    plt.show()
-    plt.savefig(f'vectors_{type_labels}.png')
+    __plot_label_vectors(v_2d, ids_to_labels, nonterminals, langs, f"Vectors {type_labels}",
+                         f'vectors_{type_labels}.png')
 
 
 def run_visualization_multilingual(args):
     model_bin = os.path.join(args.output_path, f'pytorch_model.bin')
     # load the labels
-    labels_file_path_c = os.path.join(args.output_path, 'global_labels_c.pkl')
-    labels_file_path_u = os.path.join(args.output_path, 'global_labels_u.pkl')
-    with open(labels_file_path_c, 'rb') as f:
-        goblal_labels_c = pickle.load(f)
-    goblal_labels_c = {y: x for x, y in goblal_labels_c.items()}
-    with open(labels_file_path_u, 'rb') as f:
-        goblal_labels_u = pickle.load(f)
-    goblal_labels_u = {y: x for x, y in goblal_labels_u.items()}
+    _, goblal_labels_c, nonterminals_c, langs_c = __load_global_labels(args, 'c')
+    _, goblal_labels_u, nonterminals_u, langs_u = __load_global_labels(args, 'u')
 
-    check_point = torch.load(model_bin, map_location=torch.device(args.device))
+    # only the class vectors are needed, so they are read straight from the state dict on cpu
+    check_point = torch.load(model_bin, map_location='cpu')
 
-    vectors_c = check_point['vectors_c'].detach().cpu().numpy().T
-    vectors_u = check_point['vectors_u'].detach().cpu().numpy().T
+    # one row-major float32 vector per label
+    vectors_c = np.ascontiguousarray(check_point['vectors_c'].numpy().T, dtype=np.float32)
+    vectors_u = np.ascontiguousarray(check_point['vectors_u'].numpy().T, dtype=np.float32)
 
     __visualize_dataset_after_projection(args)
 
-    # __perform_analog(vectors_c, goblal_labels_c)
-    # __run_visualization_vectors(vectors_c, goblal_labels_c, 'c', args, method='TSNE')
-    # __run_visualization_vectors(vectors_u, goblal_labels_u, 'u', args, method='TSNE')
-    # __visualize_after_displacement(vectors_c, goblal_labels_c, args, target='csharp')
+    # __perform_analog(vectors_c, goblal_labels_c, nonterminals_c, langs_c)
+    # __run_visualization_vectors(vectors_c, goblal_labels_c, nonterminals_c, langs_c, 'c', args, method='TSNE')
+    # __run_visualization_vectors(vectors_u, goblal_labels_u, nonterminals_u, langs_u, 'u', args, method='TSNE')
+    # __visualize_after_displacement(vectors_c, goblal_labels_c, nonterminals_c, langs_c, args, target='csharp')
 
 
 def __apply_kmeans(vectors, ids_to_labels, min_clusters, max_clusters, plot_name, args):
-    vectors_norm = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    vectors_norm = __normalize(vectors)
 
     plt.figure(10)
     # Instantiate the clustering model and visualizer
@@ -262,97 +322,72 @@ def __apply_kmeans(vectors, ids_to_labels, min_clusters, max_clusters, plot_name
     kmeans_final = KMeans(n_clusters=optimal, random_state=args.seed).fit(vectors_norm)
 
     labels = kmeans_final.labels_
+    visible = np.array([SEPARATOR not in ids_to_labels[ix] for ix in range(len(labels))])
     for i in range(optimal):
         logger.info(f'Cluster {i}:')
-        cont = 0
-        for ix, l in enumerate(labels):
-            if l == i and SEPARATOR not in ids_to_labels[ix]:
-                logger.info(ids_to_labels[ix])
-                cont += 1
-            if cont == 10:
-                break
+        # first ten visible labels of the cluster
+        for ix in np.flatnonzero((labels == i) & visible)[:10]:
+            logger.info(ids_to_labels[ix])
 
 
 def __perform_knn(vectors, ids_to_labels):
-    vectors = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    vectors = __normalize(vectors)
     kd_tree = KDTree(vectors)
     l2id = {y: x for x, y in ids_to_labels.items()}
-    for cand in ['for_statement--java',
-                 'unary_expression--go',
-                 'array--javascript', '<empty>--ruby']:
-        id_cand = l2id[cand]
-        _, i = kd_tree.query([vectors[id_cand]], k=10)
-        i = i[0]
+    candidates = ['for_statement--java',
+                  'unary_expression--go',
+                  'array--javascript', '<empty>--ruby']
+    # the neighbors of all the candidates in a single query
+    _, neighbors = kd_tree.query(vectors[[l2id[cand] for cand in candidates]], k=10)
+    for cand, i in zip(candidates, neighbors):
         for j, idx in enumerate(i):
             print(f'Neig k={j} for {cand} is {ids_to_labels[idx]}')
 
 
-def __perform_analog(vectors, ids_to_labels):
-    l2id = {y: x for x, y in ids_to_labels.items()}
+def __get_language_means(vectors, langs):
+    # language index of every label and mean vector of every language, in a single pass
+    lang_names, lang_ids = np.unique(langs, return_inverse=True)
+    lang_index = {lang: i for i, lang in enumerate(lang_names)}
+    sums = np.zeros((len(lang_names), vectors.shape[1]), dtype=vectors.dtype)
+    np.add.at(sums, lang_ids, vectors)
+    return lang_ids, lang_index, sums / np.bincount(lang_ids)[:, np.newaxis]
+
 
-    vectors_unit = vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+def __perform_analog(vectors, ids_to_labels, nonterminals, langs):
+    vectors_unit = __normalize(vectors)
     kd_tree = KDTree(vectors_unit)
 
     source_lang = 'csharp'
     target_lan = 'c'
 
-    list_nonterminals_source = [l.split('--')[0] for l in l2id.keys()
-                                if SEPARATOR not in l and
-                                l.endswith(f'--{source_lang}')]
-
-    for nonterminal in list_nonterminals_source:
-        # y_diff_langs = vectors[l2id[f'if_statement--{target_lan}']] - vectors[l2id[f'if_statement--{source_lang}']]
-        y_source_mean = np.mean(np.stack([vectors[l2id[x]] for x in l2id if x.endswith(f'--{source_lang}')]), axis=0)
-        y_target_mean = np.mean(np.stack([vectors[l2id[x]] for x in l2id if x.endswith(f'--{target_lan}')]), axis=0)
-        y_diff_langs = y_target_mean - y_source_mean
-        y = y_diff_langs + vectors[l2id[f'{nonterminal}--{source_lang}']]
-        y = y / np.linalg.norm(y)
-        _, i = kd_tree.query([y], k=3)
-        i = i[0]
+    ids_source = np.flatnonzero((langs == source_lang) & (np.char.find(nonterminals, SEPARATOR) < 0))
+
+    # y_diff_langs = vectors[l2id[f'if_statement--{target_lan}']] - vectors[l2id[f'if_statement--{source_lang}']]
+    _, lang_index, lang_means = __get_language_means(vectors, langs)
+    y_diff_langs = lang_means[lang_index[target_lan]] - lang_means[lang_index[source_lang]]
+    ys = __normalize(y_diff_langs + vectors[ids_source])
+    # a single query for all the analogies
+    _, neighbors = kd_tree.query(ys, k=3)
+    for nonterminal, i in zip(nonterminals[ids_source], neighbors):
         for j, idx in enumerate(i):
-            if ids_to_labels[idx].endswith(f'--{target_lan}'):
+            if langs[idx] == target_lan:
                 print(f'Neig k={j} for analogy {nonterminal}--{source_lang} is {ids_to_labels[idx]}')
 
 
-def __visualize_after_displacement(vectors, ids_to_labels, args, target='java'):
-    new_vectors = []
-    l2id = {y: x for x, y in ids_to_labels.items()}
-    y_target_mean = np.mean(np.stack([vectors[l2id[x]] for x in l2id if x.endswith(f'--{target}')]),
-                            axis=0)
-    for i, _ in enumerate(ids_to_labels):
-        l = ids_to_labels[i]
-        if l.endswith(f'--{target}'):
-            new_vectors.append(vectors[i])
-        else:
-            lang = l.split('--')[1]
-            y_source_mean = np.mean(np.stack([vectors[l2id[x]] for x in l2id if x.endswith(f'--{lang}')]),
-                                    axis=0)
-            y_diff_langs = y_target_mean - y_source_mean
-            y = y_diff_langs + vectors[i]
-            new_vectors.append(y)
-
-    __apply_kmeans(np.stack(new_vectors), ids_to_labels,
+def __visualize_after_displacement(vectors, ids_to_labels, nonterminals, langs, args, target='java'):
+    # move every vector by the difference between the mean of the target language and the mean of its language
+    lang_ids, lang_index, lang_means = __get_language_means(vectors, langs)
+    new_vectors = vectors + (lang_means[lang_index[target]] - lang_means[lang_ids])
+    new_vectors[lang_ids == lang_index[target]] = vectors[lang_ids == lang_index[target]]
+
+    __apply_kmeans(new_vectors, ids_to_labels,
                    4, 80, f'elbow_displacement_{target}.png', args)
 
-    vectors = np.stack(new_vectors) / np.linalg.norm(np.stack(new_vectors), axis=1)[:, np.newaxis]
-    v_2d = TSNE(n_components=2, learning_rate='auto',
-                init='random', random_state=args.seed).fit_transform(vectors)
+    vectors = __normalize(new_vectors, inplace=True)
+    v_2d = __run_projection(vectors, args)
 
-    figure, axis = plt.subplots(1, figsize=(20, 20))
-    axis.set_title(f"Vectors displaced to {target}")
-    for ix, label in ids_to_labels.items():
-        if SEPARATOR in label:
-            continue
-        l = label.split('--')[1]
-        axis.scatter(v_2d[ix, 0], v_2d[ix, 1], color=COLORS[l], label=l)
-
-    for ix, label in ids_to_labels.items():
-        if SEPARATOR in label:
-            continue
-        nt = label.split('--')[0]
-        axis.annotate(nt, (v_2d[ix, 0], v_2d[ix, 1]))
-    plt.show()
-    plt.savefig(f'vectors_displaced_{target}.png')
+    __plot_label_vectors(v_2d, ids_to_labels, nonterminals, langs, f"Vectors displaced to {target}",
+                         f'vectors_displaced_{target}.png', annotate_nonterminals=True)
 
 
 def __visualize_dataset_after_projection(args):
@@ -360,14 +395,9 @@ def __visualize_dataset_after_projection(args):
     tokenizer = AutoTokenizer.from_pretrained(args.pretrained_model_name_or_path)
 
     # load dictionaries
-    labels_file_path_c = os.path.join(args.output_path, 'global_labels_c.pkl')
-    labels_file_path_u = os.path.join(args.output_path, 'global_labels_u.pkl')
-    with open(labels_file_path_c, 'rb') as f:
-        labels_to_ids_c_global = pickle.load(f)
-    ids_to_labels_c_global = {y: x for x, y in labels_to_ids_c_global.items()}
-    with open(labels_file_path_u, 'rb') as f:
-        labels_to_ids_u_global = pickle.load(f)
-    ids_to_labels_u_global = {y: x for x, y in labels_to_ids_u_global.items()}
+    labels_to_ids_c_global, ids_to_labels_c_global, label_nonterminals, label_langs = \
+        __load_global_labels(args, 'c')
+    labels_to_ids_u_global, ids_to_labels_u_global, _, _ = __load_global_labels(args, 'u')
 
     # load models
     lmodel = get_lmodel(args)
@@ -388,8 +418,7 @@ def __visualize_dataset_after_projection(args):
         data_files[f'test_{lang}'] = os.path.join(args.dataset_name_or_path, lang, 'test.jsonl')
 
     data_sets = {x: load_dataset('json', data_files=y) for x, y in data_files.items()}
-    data_sets = {x: y.map(lambda e: convert_sample_to_features(e['original_string'], parsers[x.split('_')[1]],
-                                                               x.split('_')[1]))
+    data_sets = {x: convert_dataset_to_features(y['train'], x.split('_')[1], args.num_proc)
                  for x, y in data_sets.items()}
 
     data_sets = {x: y.map(lambda e: convert_to_ids_multilingual(e['c'], 'c', labels_to_ids_c_global, x.split('_')[1]))
@@ -397,9 +426,9 @@ def __visualize_dataset_after_projection(args):
     data_sets = {x: y.map(lambda e: convert_to_ids_multilingual(e['u'], 'u', labels_to_ids_u_global, x.split('_')[1]))
                  for x, y in data_sets.items()}
 
-    train_datasets = [y['train'] for x, y in data_sets.items() if 'train_' in x]
-    valid_datasets = [y['train'] for x, y in data_sets.items() if 'valid_' in x]
-    test_datasets = [y['train'] for x, y in data_sets.items() if 'test_' in x]
+    train_datasets = [y for x, y in data_sets.items() if 'train_' in x]
+    valid_datasets = [y for x, y in data_sets.items() if 'valid_' in x]
+    test_datasets = [y for x, y in data_sets.items() if 'test_' in x]
 
     # train_set = concatenate_datasets(train_datasets)
     # valid_set = concatenate_datasets(valid_datasets)
@@ -438,9 +467,9 @@ def __visualize_dataset_after_projection(args):
     projections = np.concatenate(projections, axis=0)
     all_cs = np.concatenate(all_cs, axis=0)
 
-    mask = [('<empty>' not in ids_to_labels_c_global[c]
-             and SEPARATOR not in ids_to_labels_c_global[c])
-            for c in all_cs]
+    # the labels were parsed at load time, the arrays are indexed by the class of every token
+    label_mask = (np.char.find(label_nonterminals, '<empty>') < 0) & (np.char.find(label_nonterminals, SEPARATOR) < 0)
+    mask = label_mask[all_cs]
     projections = projections[mask]
     all_cs = all_cs[mask]
 
@@ -461,19 +490,19 @@ def __visualize_dataset_after_projection(args):
     # all_cs = all_cs[idx]
     # langs = langs[idx]
 
-    vectors = projections / np.linalg.norm(np.stack(projections), axis=1)[:, np.newaxis]
+    vectors = __normalize(projections, inplace=True)
     try:
-        v_2d = np.load(os.path.join(args.output_path, 'tsne_embeddings.np.npy'))
+        v_2d = np.load(os.path.join(args.output_path, f'{args.projection}_embeddings.np.npy'))
         all_cs = np.load(os.path.join(args.output_path, 'all_cs.np.npy'))
     except:
         logger.info('Cannot load embeddings, recomputing')
-        tsne_obj = TSNE(n_components=2, n_jobs=12, random_state=args.seed, verbose=True).fit(vectors)
-        v_2d = tsne_obj.transform(vectors)
-        np.save(os.path.join(args.output_path, 'tsne_embeddings.np'), v_2d)
+        # the embeddings are already saved next to the labels, the t-SNE cache would store a second copy
+        v_2d = __run_projection(vectors, args, initialization='pca', verbose=True, use_cache=False)
+        np.save(os.path.join(args.output_path, f'{args.projection}_embeddings.np'), v_2d)
         np.save(os.path.join(args.output_path, 'all_cs.np'), all_cs)
 
-    langs = np.array([ids_to_labels_c_global[c].split('--')[1] for c in all_cs])
-    all_cs = np.array([ids_to_labels_c_global[c].split('--')[0] for c in all_cs])
+    langs = label_langs[all_cs]
+    all_cs = label_nonterminals[all_cs]
 
     figure, axis = plt.subplots(1, figsize=(20, 20))
     markers = {
@@ -505,8 +534,8 @@ def __visualize_dataset_after_projection(args):
             axis.scatter(v_2d[i, 0], v_2d[i, 1], color='g', alpha=0.3)
     # axis.legend()
     # axis.scatter(v_2d[:, 0], v_2d[:, 1])
-    plt.show()
     plt.savefig(f'test_projected.png')
+    plt.close(figure)
 
     fig = px.scatter(x=v_2d[:, 0], y=v_2d[:, 1], color=all_cs)
     fig.update_layout(showlegend=False)
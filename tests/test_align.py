@@ -1,12 +1,15 @@
 import unittest
-from transformers import BertTokenizer, RobertaTokenizer
+from transformers import AutoTokenizer, BertTokenizer, RobertaTokenizer
 
 from src.data.code2ast import code2ast, get_tokens_ast
 from src.data import PARSER_OBJECT_BY_NAME
-from src.data.utils import match_tokenized_to_untokenized_bert, match_tokenized_to_untokenized_roberta
+from src.data.utils import match_tokenized_to_untokenized_bert, match_tokenized_to_untokenized_roberta, \
+    get_number_subtokens
 
 bert_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
 roberta_tokenizer = RobertaTokenizer.from_pretrained('roberta-base')
+bert_tokenizer_fast = AutoTokenizer.from_pretrained('bert-base-uncased')
+roberta_tokenizer_fast = AutoTokenizer.from_pretrained('roberta-base')
 
 code = """'''Compute the maximum'''
 def max(a,b):
@@ -35,6 +38,19 @@ class TestAlign(unittest.TestCase):
         print(mapping)
         self.assertEqual(True, True)  # todo
 
+    def test_number_subtokens_wordpiece(self):
+        for tokenizer in [bert_tokenizer, bert_tokenizer_fast]:
+            t, _ = match_tokenized_to_untokenized_bert(untokenized_sent=code_tokens, tokenizer=tokenizer)
+            self.assertEqual(get_number_subtokens(code_tokens, tokenizer, bpe=False), len(t))
+
+    def test_number_subtokens_blbpe(self):
+        # with the space prepended, a token starting with a space is encoded with a lone 'Ġ'
+        tokens = code_tokens + [' b']
+        self.assertIn('Ġ', roberta_tokenizer.tokenize('  b'))
+        for tokenizer in [roberta_tokenizer, roberta_tokenizer_fast]:
+            t, _ = match_tokenized_to_untokenized_roberta(untokenized_sent=tokens, tokenizer=tokenizer)
+            self.assertEqual(get_number_subtokens(tokens, tokenizer, bpe=True), len(t))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import networkx as nx
 
@@ -28,11 +30,7 @@ code_csharp = """public static int max(int a, int b) {
 
 
 def print_beautiful(tokens, c, d):
-    result = ""
-    for j, c_j in enumerate(c):
-        result += f"[{tokens[j]}]" + f"-{c_j}{d[j]}-"
-    result += tokens[-1]
-    return result
+    return ''.join(f"[{tokens[j]}]" + f"-{c_j}{d[j]}-" for j, c_j in enumerate(c)) + tokens[-1]
 
 
 class Comparison(unittest.TestCase):
@@ -43,7 +41,7 @@ class Comparison(unittest.TestCase):
         d, c, _, u = tree_to_distance(binary_ast, 0)
         print(print_beautiful(get_tokens_ast(G, pre_code), c, d))
         nx.draw(nx.Graph(G), labels=nx.get_node_attributes(G, 'type'), with_labels=True)
-        plt.show()
+        plt.close()
         print(d)
         print(get_tokens_ast(G, pre_code))
 
@@ -54,7 +52,7 @@ class Comparison(unittest.TestCase):
         d, c, _, u = tree_to_distance(binary_ast, 0)
         print(print_beautiful(get_tokens_ast(G, pre_code), c, d))
         nx.draw(nx.Graph(G), labels=nx.get_node_attributes(G, 'type'), with_labels=True)
-        plt.show()
+        plt.close()
         print(d)
         print(get_tokens_ast(G, pre_code))
 
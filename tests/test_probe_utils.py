@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from torch_scatter import scatter_mean
+
+from src.probe.utils import EmbeddingsCache, align_function
+
+
+# reference per-sample alignment
+def align_function_per_sample(embs, align):
+    seq = []
+    for j, emb in enumerate(embs):
+        seq.append(scatter_mean(emb, align[j], dim=0))
+    return pad_sequence(seq, batch_first=True)[:, :-1, :]
+
+
+class TestAlignFunction(unittest.TestCase):
+
+    def test_align_function(self):
+        # samples with a different number of words, the last index of each row is the padding of the sample
+        align = torch.tensor([[0, 0, 1, 2, 2, 3, 3],
+                              [0, 1, 1, 2, 2, 2, 2],
+                              [0, 1, 1, 2, 3, 4, 5]])
+        embs = torch.randn(3, 7, 4)
+        aligned = align_function(embs, align)
+        self.assertEqual(aligned.shape, (3, 5, 4))
+        self.assertTrue(torch.allclose(aligned, align_function_per_sample(embs, align)))
+
+
+class TestEmbeddingsCache(unittest.TestCase):
+
+    def test_store_get_batch(self):
+        lengths = [3, 1, 2]
+        hidden_dim = 4
+        embs = torch.arange(3 * 5 * hidden_dim, dtype=torch.float32).view(3, 5, hidden_dim)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'embeddings.bin')
+            cache = EmbeddingsCache(path, lengths, hidden_dim)
+            # stored out of order and in two batches, with padding after the last word of every sample
+            cache.store(torch.tensor([2, 0]), embs[[2, 0]])
+            cache.store(torch.tensor([1]), embs[[1]])
+
+            batch = cache.get_batch(torch.tensor([1, 2]))
+            self.assertEqual(batch.shape, (2, 2, hidden_dim))
+            self.assertTrue(torch.equal(batch[0, :1], embs[1, :1]))
+            self.assertTrue(torch.equal(batch[0, 1:], torch.zeros(1, hidden_dim)))
+            self.assertTrue(torch.equal(batch[1], embs[2, :2]))
+
+            batch = cache.get_batch(torch.tensor([0, 1, 2]))
+            self.assertEqual(batch.shape, (3, 3, hidden_dim))
+            for i, length in enumerate(lengths):
+                self.assertTrue(torch.equal(batch[i, :length], embs[i, :length]))
+                self.assertTrue(torch.equal(batch[i, length:], torch.zeros(3 - length, hidden_dim)))
+
+            cache.remove()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()